@@ -1,3 +1,3 @@
-from .logger import logger, set_verbosity
+from .log import logger, set_verbosity
 __all__ = [logger, set_verbosity]
 
@@ -23,6 +23,8 @@ from artifice import utils
 from artifice import img
 from artifice import vis
 
+AUTOTUNE = tf.data.experimental.AUTOTUNE
+
 
 def _bytes_feature(value):
   """Returns a bytes_list from a string / byte."""
@@ -51,7 +53,7 @@ Parsing and serialization functions.
 
 def proto_from_image(image):
   image = img.as_float(image)
-  feature = {'image': _bytes_feature(image.tostring()),
+  feature = {'image': _bytes_feature(image.tobytes()),
              'image_dim0': _int64_feature(image.shape[0]),
              'image_dim1': _int64_feature(image.shape[1]),
              'image_dim2': _int64_feature(image.shape[2])}
@@ -75,11 +77,11 @@ def proto_from_example(example):
   image, label = example
   image = img.as_float(image)
   label = label.astype(np.float32)
-  feature = {'image': _bytes_feature(image.tostring()),
+  feature = {'image': _bytes_feature(image.tobytes()),
              'image_dim0': _int64_feature(image.shape[0]),
              'image_dim1': _int64_feature(image.shape[1]),
              'image_dim2': _int64_feature(image.shape[2]),
-             'label': _bytes_feature(label.tostring()),
+             'label': _bytes_feature(label.tobytes()),
              'label_dim0': _int64_feature(label.shape[0]),
              'label_dim1': _int64_feature(label.shape[1])}
   return _serialize_feature(feature)
@@ -109,14 +111,14 @@ def proto_from_annotated_example(example):
   image = img.as_float(image)
   label = label.astype(np.float32)
   annotation = img.as_float(annotation)
-  feature = {'image': _bytes_feature(image.tostring()),
+  feature = {'image': _bytes_feature(image.tobytes()),
              'image_dim0': _int64_feature(image.shape[0]),
              'image_dim1': _int64_feature(image.shape[1]),
              'image_dim2': _int64_feature(image.shape[2]),
-             'label': _bytes_feature(label.tostring()),
+             'label': _bytes_feature(label.tobytes()),
              'label_dim0': _int64_feature(label.shape[0]),
              'label_dim1': _int64_feature(label.shape[1]),
-             'annotation': _bytes_feature(annotation.tostring()),
+             'annotation': _bytes_feature(annotation.tobytes()),
              'annotation_dim0': _int64_feature(annotation.shape[0]),
              'annotation_dim1': _int64_feature(annotation.shape[1]),
              'annotation_dim2': _int64_feature(annotation.shape[2])}
@@ -223,7 +225,8 @@ class ArtificeData(object):
 
   def __init__(self, record_path, *, size, image_shape, input_tile_shape,
                output_tile_shapes, batch_size, num_parallel_calls=None,
-               num_shuffle=10000, cache_dir='cache', **kwargs):
+               num_shuffle=10000, cache_dir='cache', prefetch_device=None,
+               **kwargs):
     """Initialize the data, loading it if necessary..
 
     kwargs is there only to allow extraneous keyword arguments. It is not used.
@@ -239,6 +242,9 @@ class ArtificeData(object):
     :param num_parallel_calls:
     :param num_shuffle:
     :param cache_dir:
+    :param prefetch_device: if provided, such as '/gpu:0', training batches
+    are prefetched into this device's memory, so the next batch is already
+    there when a step starts. Other modes prefetch in host memory.
     :returns:
     :rtype:
 
@@ -254,12 +260,13 @@ class ArtificeData(object):
     self.num_parallel_calls = num_parallel_calls
     self.num_shuffle = num_shuffle
     self.cache_dir = os.path.abspath(cache_dir)
+    self.prefetch_device = prefetch_device
 
     # derived
     self.output_tile_shape = output_tile_shapes[-1]
     self.num_tiles = self.compute_num_tiles(self.image_shape,
                                             self.output_tile_shape)
-    self.prefetch_buffer_size = self.batch_size
+    self.prefetch_buffer_size = AUTOTUNE
     self.block_length = self.num_tiles
 
   @property
@@ -272,27 +279,57 @@ class ArtificeData(object):
         record_names.append(path)
     return record_names
 
+  @property
+  def record_patterns(self):
+    return [os.path.join(path, "*.tfrecord") if os.path.isdir(path) else path
+            for path in self.record_paths]
+
+  def record_dataset(self, mode=None):
+    """Make a dataset of serialized examples from every record file.
+
+    The patterns in `record_patterns` are matched each time the dataset is
+    iterated over, rather than when it is created, so a repeated dataset picks
+    up any records written since its last pass.
+
+    :param mode: if TRAINING, read from several files in parallel, in whatever
+    order examples become available. Otherwise, files are read in order, with
+    the files matching each pattern sorted by name, so sharded records such as
+    data-000.tfrecord, data-001.tfrecord, ... are read in shard order.
+
+    """
+    record_names = (tf.data.Dataset.from_tensor_slices(self.record_patterns)
+                    .flat_map(lambda pattern: tf.data.Dataset
+                              .from_tensor_slices(tf.matching_files(pattern))))
+    if mode == ArtificeData.TRAINING:
+      return record_names.apply(tf.data.experimental.parallel_interleave(
+        tf.data.TFRecordDataset, cycle_length=self.num_parallel_calls,
+        sloppy=True))
+    return tf.data.TFRecordDataset(record_names)
+
   @staticmethod
   def serialize(entry):
     raise NotImplementedError("subclass should implement")
 
   def process(self, dataset, mode):
-    """Process the dataset of serialized examples into tensors ready for input.
+    """Process the dataset of parsed examples into tensors ready for input.
 
     todo: update this documentation for modes.
 
     The full data processing pipeline is:
     * deserialize example
+    * cache (if applicable)
     * augment (if applicable)
-    * convert to proxy
     * tile
+    * convert to proxy (if mode is TRAINING)
+    * batch
     * shuffle (if mode is TRAINING)
     * repeat
-    * batch
 
-    `process()` does steps 2,3, and 4. MUST return
+    `get_input()` does steps 1 and 2, and `process()` does steps 3 and 4. The
+    rest is left to `postprocess()`, which fuses the proxy conversion with
+    batching. MUST return
 
-    :param dataset:
+    :param dataset: dataset of parsed examples, as returned by `parse()`
     :param training: if this is for training
     :returns:
     :rtype:
@@ -300,25 +337,66 @@ class ArtificeData(object):
     """
     raise NotImplementedError("subclasses should implement")
 
-  def postprocess(self, dataset, mode, cache=False):
+  def postprocess(self, dataset, mode):
     if "ENUMERATED" in mode:
       dataset = dataset.apply(tf.data.experimental.enumerate_dataset())
-    if cache:
-      logger.info("caching this epoch...")
-      dataset = dataset.repeat(-1).take(self.size).cache(self.cache_dir)
-    dataset = dataset.batch(self.batch_size, drop_remainder=True)
+    if mode == ArtificeData.TRAINING:
+      dataset = dataset.apply(tf.data.experimental.map_and_batch(
+        self.make_proxies_map_func, self.batch_size,
+        num_parallel_calls=AUTOTUNE, drop_remainder=True))
+    else:
+      dataset = dataset.batch(self.batch_size, drop_remainder=True)
     if mode == ArtificeData.TRAINING:
       dataset = dataset.shuffle(self.num_shuffle)
     dataset = dataset.repeat(-1)
     if mode != ArtificeData.TRAINING:
       dataset = dataset.take(self.steps_per_epoch)
-    dataset = dataset.prefetch(self.prefetch_buffer_size)
+    if mode == ArtificeData.TRAINING:
+      dataset = dataset.with_options(self.training_options)
+    if self.prefetch_device is None or mode != ArtificeData.TRAINING:
+      dataset = dataset.prefetch(self.prefetch_buffer_size)
+    else:
+      # must be the last transformation. Only for training, which keras
+      # consumes directly: one-shot iterators, used for prediction in graph
+      # mode, can't be made on device-copied datasets.
+      dataset = dataset.apply(tf.data.experimental.prefetch_to_device(
+        self.prefetch_device, buffer_size=self.prefetch_buffer_size))
     return dataset
 
+  @property
+  def training_options(self):
+    """Static optimizations and threading for the training pipeline.
+
+    Training examples are shuffled anyway, so elements are allowed to come out
+    of order. Other modes keep the default options, since untiling relies on
+    the tiles of each image staying together and in order.
+
+    """
+    options = tf.data.Options()
+    options.experimental_deterministic = False
+    if hasattr(options, 'experimental_optimization'):
+      # tf >= 1.14
+      options.experimental_optimization.map_and_batch_fusion = True
+      options.experimental_optimization.map_parallelization = True
+      if self.num_parallel_calls:
+        options.experimental_threading.private_threadpool_size = (
+          self.num_parallel_calls)
+      options.experimental_threading.max_intra_op_parallelism = 1
+    else:
+      options.experimental_map_and_batch_fusion = True
+      options.experimental_map_parallelization = True
+    return options
+
   def get_input(self, mode, cache=False):
-    dataset = tf.data.TFRecordDataset(self.record_names)
+    dataset = self.record_dataset(mode)
+    dataset = dataset.map(self.parse, num_parallel_calls=AUTOTUNE)
+    if cache:
+      # Cache right after decoding, never after augmentation or shuffling,
+      # which would freeze them into the cache and repeat them every epoch.
+      logger.info("caching parsed examples...")
+      dataset = dataset.cache(self.cache_dir)
     dataset = self.process(dataset, mode)
-    return self.postprocess(dataset, mode, cache=cache)
+    return self.postprocess(dataset, mode)
 
   def training_input(self, cache=False):
     return self.get_input(ArtificeData.TRAINING, cache=cache)
@@ -390,6 +468,8 @@ class ArtificeData(object):
   # todo: determing whether to use tf.image.extract_image_patches instead
 
   def tile_image(self, image):
+    # parsed images have dynamic shape, fix it so tiles are static too
+    image.set_shape(self.image_shape)
     image = tf.pad(image, self.image_padding(), 'CONSTANT')
     tiles = []
     for i in range(0, self.image_shape[0], self.output_tile_shape[0]):
@@ -399,6 +479,7 @@ class ArtificeData(object):
     return tf.data.Dataset.from_tensor_slices(tiles)
 
   def tile_image_label(self, image, label):
+    image.set_shape(self.image_shape)
     image = tf.pad(image, self.image_padding(), 'CONSTANT')
     tiles = []
     labels = []
@@ -418,6 +499,14 @@ class ArtificeData(object):
     todo: remember, label could be empty.
 
     """
+    # pixel centers at each level, [H*W,1,2], built once rather than per call
+    level_points = []
+    for tile_shape in self.output_tile_shapes:
+      i, j = np.meshgrid(np.arange(tile_shape[0], dtype=np.float32) + 0.5,
+                         np.arange(tile_shape[1], dtype=np.float32) + 0.5,
+                         indexing='ij')
+      level_points.append(np.stack((i, j), axis=-1).reshape(-1, 1, 2))
+
     def map_func(tile, label):
       proxy_set = []
       positions = tf.cast(label[:, :2], tf.float32)  # [num_objects, 2]
@@ -428,10 +517,7 @@ class ArtificeData(object):
         translation = tf.constant([[dx, dy]], dtype=tf.float32)
         level_positions = (positions + translation) / scale_factor
 
-        points = tf.constant(np.array(  # [H*W,2]
-            [np.array([i + 0.5, j + 0.5]) for i in range(tile_shape[0])
-             for j in range(tile_shape[1])], dtype=np.float32), tf.float32)
-        points = tf.expand_dims(points, axis=1)                # [H*W,1,2]
+        points = tf.constant(level_points[level], tf.float32)  # [H*W,1,2]
         level_positions = tf.expand_dims(level_positions, axis=0)
         object_distances = tf.norm(
             points - level_positions, axis=-1)  # [H*W,num_objects]
@@ -529,27 +615,43 @@ class ArtificeData(object):
     :returns: prediction in the same shape as original labels
     :rtype: np.ndarray
 
+    """
+    return self.analyze_tiled_outputs(
+        [np.stack(output) for output in zip(*outputs[:self.num_tiles])],
+        multiscale=multiscale)
+
+  def analyze_tiled_outputs(self, outputs, multiscale=False, dist_image=None):
+    """Analyze the model outputs for one image, with the tiles stacked.
+
+    :param outputs: list with an array for each model output, like
+    [pose, level_output_0, level_output_1, ...], each containing exactly
+    num_tiles tiles along the first axis.
+    :param dist_image: the untiled distance channel of `outputs[-1]`, if the
+    caller already has it.
+    :returns: prediction in the same shape as original labels
+    :rtype: np.ndarray
+
     """
 
     if multiscale:
-      peaks = self.untile_points([multiscale_detect_peaks(output[1:])
-                                  for output in outputs[:self.num_tiles]])
+      peaks = self.untile_points(
+          [multiscale_detect_peaks([output[i] for output in outputs[1:]])
+           for i in range(self.num_tiles)])
     else:
       peaks = None
 
     # check peaks, possible conflicts at edges:
     # todo: limit checks to edges AND regions
-    dist_image = self.untile([output[-1][:, :, 0] for output in
-                              outputs[:self.num_tiles]])
+    if dist_image is None:
+      dist_image = self.untile(outputs[-1][:, :, :, 0])
     peaks = detect_peaks(dist_image, pois=peaks)
 
-    pose_image = self.untile([output[0]
-                              for output in outputs[:self.num_tiles]])
+    pose_image = self.untile(outputs[0])
     prediction = np.empty((peaks.shape[0], 1 + pose_image.shape[-1]),
                           dtype=np.float32)
-    for i, peak in enumerate(peaks):
-      prediction[i, :2] = peak
-      prediction[i, 2:] = pose_image[int(peak[0]), int(peak[1]), 1:]
+    prediction[:, :2] = peaks
+    prediction[:, 2:] = pose_image[peaks[:, 0].astype(np.int64),
+                                   peaks[:, 1].astype(np.int64), 1:]
     return prediction
 
   def accumulate(self, accumulator):
@@ -616,14 +718,14 @@ class UnlabeledData(ArtificeData):
     return image_from_proto(proto)
 
   def process(self, dataset, mode):
-    def map_func(proto):
-      image = self.parse(proto)[0]
+    def map_func(*entry):
+      image = entry[0]
       if mode in [ArtificeData.PREDICTION, ArtificeData.ENUMERATED_PREDICTION]:
         return self.tile_image(image)
       raise ValueError(f"{mode} mode invalid for UnlabeledData")
     return dataset.interleave(map_func, cycle_length=self.num_parallel_calls,
                               block_length=self.block_length,
-                              num_parallel_calls=self.num_parallel_calls)
+                              num_parallel_calls=AUTOTUNE)
 
 
 class LabeledData(ArtificeData):
@@ -648,20 +750,19 @@ class LabeledData(ArtificeData):
     return self.accumulate(self.label_accumulator)
 
   def process(self, dataset, mode):
-    def map_func(proto):
-      image, label = self.parse(proto)[:2]
+    def map_func(*entry):
+      image, label = entry[:2]
       if mode in [ArtificeData.PREDICTION, ArtificeData.ENUMERATED_PREDICTION]:
         return self.tile_image(image)
 
       if mode == ArtificeData.EVALUATION:
         return self.tile_image_label(image, label)
       if mode == ArtificeData.TRAINING:
-        tiled_set = self.tile_image_label(image, label)
-        return tiled_set.map(self.make_proxies_map_func)
+        return self.tile_image_label(image, label)
       raise ValueError(f"{mode} mode invalid for LabeledData")
     return dataset.interleave(map_func, cycle_length=self.num_parallel_calls,
                               block_length=self.block_length,
-                              num_parallel_calls=self.num_parallel_calls)
+                              num_parallel_calls=AUTOTUNE)
 
 
 class AnnotatedData(LabeledData):
@@ -698,6 +799,7 @@ class AnnotatedData(LabeledData):
     """
     self.transformation = transformation
     self.identity_prob = identity_prob
+    self._background = None
     super().__init__(*args, **kwargs)
 
   @staticmethod
@@ -712,8 +814,8 @@ class AnnotatedData(LabeledData):
     if self.transformation is not None:
       background = self.get_background()
 
-    def map_func(proto):
-      image, label, annotation = self.parse(proto)[:3]
+    def map_func(*entry):
+      image, label, annotation = entry[:3]
       if self.transformation is not None:
         image, label = self.augment(image, label, annotation, background)
       if mode == ArtificeData.PREDICTION:
@@ -722,12 +824,11 @@ class AnnotatedData(LabeledData):
       if mode == ArtificeData.EVALUATION:
         return self.tile_image_label(image, label)
       if mode == ArtificeData.TRAINING:
-        tiled_set = self.tile_image_label(image, label)
-        return tiled_set.map(self.make_proxies_map_func)
+        return self.tile_image_label(image, label)
       raise ValueError(f"{mode} mode invalid for AnnotatedData")
     return dataset.interleave(map_func, cycle_length=self.num_parallel_calls,
                               block_length=self.block_length,
-                              num_parallel_calls=self.num_parallel_calls)
+                              num_parallel_calls=AUTOTUNE)
 
   def augment(self, image, label, annotation, background):
     """Augment an example using self.transformation.
@@ -825,7 +926,15 @@ class AnnotatedData(LabeledData):
     return background
 
   def get_background(self):
-    return self.accumulate(self.greedy_background_accumulator)
+    """Get the background image, accumulating it over the data the first time.
+
+    Each input mode builds its own pipeline, so the result is kept rather than
+    re-reading the whole dataset for every one.
+
+    """
+    if self._background is None:
+      self._background = self.accumulate(self.greedy_background_accumulator)
+    return self._background
 
 
 """
@@ -892,6 +1001,28 @@ def multiscale_detect_peaks(images):
   return peaks
 
 
+def multiscale_detect_peaks_batch(batch_images):
+  """Run `multiscale_detect_peaks` over every image in a batch.
+
+  :param batch_images: list of batched images at each scale, smallest first,
+  as returned by the model.
+  :returns: `(indices, counts)`, where `indices` is an `[N,3]` int array of
+  `(batch index, row, column)` for all N peaks in the batch, and `counts` is
+  the number of peaks found in each image.
+  :rtype: tuple
+
+  """
+  batch_size = batch_images[0].shape[0]
+  peaks = [multiscale_detect_peaks([images[b] for images in batch_images])
+           for b in range(batch_size)]
+  counts = np.array([p.shape[0] for p in peaks], np.int64)
+  indices = np.empty((counts.sum(), 3), np.int64)
+  indices[:, 0] = np.repeat(np.arange(batch_size), counts)
+  if indices.shape[0] > 0:
+    indices[:, 1:] = np.concatenate(peaks)
+  return indices, counts
+
+
 def evaluate_prediction(label, prediction, distance_threshold=10):
   """Evaluage the prediction against the label and return an array of absolute
 
@@ -53,11 +53,20 @@ tol = "todo"
 
 # runtime settings
 num_parallel_calls = "Threadpool size. Default (-1) uses available cores."
+prefetch_device = """Device to prefetch training batches to, such as /gpu:0,
+hiding the host to device copy. Only applies to the "train" command; other
+commands, and the default, prefetch in host memory."""
 verbose = "Artifice verbosity. Default is 2 (debug level)."
 keras_verbose = "Keras verbosity. Default is 1 (progress bars)."
 patient = "Disable eager execution."
+jit = """Enable XLA JIT compilation, which fuses the conv, batch norm, and
+activation ops of the model into fewer kernels. Requires --patient; ignored
+with eager execution."""
+mixed_precision = """Train in mixed float16/float32 precision with loss scaling,
+for Tensor Core GPUs. Requires TensorFlow 1.14 or higher and --patient;
+ignored with eager execution."""
+precision = """Float type for the "predict" command. float16 halves the memory
+traffic of inference. Default is float32."""
 show = "Show plots rather than save them."
-cache = "cache the pipelined dataset"
-seconds = """Limits runtime for "prioritize" and "annotate" commands. For "train," sets
-the time after which the dataset is no longer reloaded every epoch, and caching
-can occur."""
+cache = "cache the parsed examples, so records are only decoded once"
+seconds = """Limits runtime for "prioritize" and "annotate" commands."""
@@ -6,7 +6,7 @@ import numpy as np
 from PIL import Image
 from skimage import draw
 
-from artifice.log import logger  # noqa: F401
+from artifice.log import logger
 
 
 """
@@ -238,16 +238,24 @@ def get_inside(xs, ys, shape, vals=None):
 def fill_negatives(image):
   """Fill the negative values in background with gaussian noise.
 
+  The noise is clipped to the range of the existing values, so that no filled
+  pixel is negative.
+
   : param image: a numpy array with negative values to fill
 
   """
   image = image.copy()
   indices = image >= 0
-  mean = image[indices].mean()
-  std = image[indices].std()
+  values = image[indices]
+  if values.size == 0:
+    logger.warning("no known values to fill negatives from")
+    return image
+  mean = values.mean()
+  std = values.std()
 
   indices = image < 0
-  image[indices] = np.random.normal(mean, std, size=image[indices].shape)
+  noise = np.random.normal(mean, std, size=indices.sum())
+  image[indices] = np.clip(noise, values.min(), values.max())
   return image
 
 
@@ -34,9 +34,24 @@ def _system_checks():
     exit()
 
 
-def _set_eager(eager):
+def _set_eager(eager, jit=False):
+  """Enable eager execution or set the keras session, with XLA if `jit`.
+
+  The config has to be set here, before anything else touches the default
+  context or session. XLA auto-clustering only applies to graphs run by the
+  session, so `jit` has no effect with eager execution.
+
+  """
+  config = tf.ConfigProto()
+  if jit and eager:
+    logger.warning("--jit only applies with --patient (graph mode), ignoring")
+  elif jit:
+    config.graph_options.optimizer_options.global_jit_level = (
+        tf.OptimizerOptions.ON_1)
   if eager:
-    tf.enable_eager_execution()
+    tf.enable_eager_execution(config=config)
+  else:
+    tf.keras.backend.set_session(tf.Session(config=config))
 
 
 def _ensure_dirs_exist(dirs):
@@ -91,9 +106,13 @@ class Artifice:
                learning_rate,
                tol,
                num_parallel_calls,
+               prefetch_device,
                verbose,
                keras_verbose,
                eager,
+               jit,
+               mixed_precision,
+               precision,
                show,
                cache,
                seconds):
@@ -147,16 +166,20 @@ class Artifice:
 
     # runtime settings
     self.num_parallel_calls = num_parallel_calls
+    self.prefetch_device = prefetch_device
     self.verbose = verbose
     self.keras_verbose = keras_verbose
     self.eager = eager
+    self.jit = jit
+    self.mixed_precision = mixed_precision
+    self.precision = precision
     self.show = show
     self.cache = cache
     self.seconds = seconds
 
     # globals
     log.set_verbosity(self.verbose)
-    _set_eager(self.eager)
+    _set_eager(self.eager, jit=self.jit)
     vis.set_show(self.show)
     self._set_num_parallel_calls()
 
@@ -206,7 +229,8 @@ todo: other attributes"""
 
   def _set_num_parallel_calls(self):
     if self.num_parallel_calls <= 0:
-      self.num_parallel_calls = os.cpu_count()
+      self.num_parallel_calls = utils.available_cpus()
+    logger.debug(f"num_parallel_calls: {self.num_parallel_calls}")
 
   """
   Loading datasets and models.
@@ -220,7 +244,8 @@ todo: other attributes"""
             'batch_size': self.batch_size,
             'num_parallel_calls': self.num_parallel_calls,
             'num_shuffle': min(self.data_size, self.num_shuffle),
-            'cache_dir': self.cache_dir}
+            'cache_dir': self.cache_dir,
+            'prefetch_device': self.prefetch_device}
 
   def _load_labeled(self):
     return dat.LabeledData(join(self.data_root, 'labeled_set.tfrecord'),
@@ -255,11 +280,11 @@ todo: other attributes"""
               'dropout': self.dropout,
               'model_dir': self.model_root,
               'learning_rate': self.learning_rate,
-              'overwrite': self.overwrite}
-    if (self.use_var and self.model == 'sparse'
-        or self.model == 'better-sparse'
-        or self.model == 'auto-sparse'):
-      kwargs['batch_size'] = self.batch_size
+              'overwrite': self.overwrite,
+              'mixed_precision': self.mixed_precision,
+              'batch_size': self.batch_size}
+    if self.model == 'sparse':
+      kwargs['use_var'] = self.use_var
     if 'sparse' in self.model:
       kwargs['tol'] = self.tol
     return kwargs
@@ -356,13 +381,13 @@ todo: other attributes"""
     model.train(train_set, epochs=self.epochs,
                 initial_epoch=self.initial_epoch,
                 verbose=self.keras_verbose,
-                seconds=self.seconds,
                 cache=self.cache)
 
   def predict(self):
     """Run prediction on the unlabeled set."""
     unlabeled_set = self._load_unlabeled()
     model = self._load_model()
+    model.cast(self.precision)
     start_time = time()
     predictions = list(model.predict(
         unlabeled_set, multiscale=self.multiscale))
@@ -377,7 +402,7 @@ todo: other attributes"""
     test_set = self._load_test()
     model = self._load_model()
     errors, num_failed = model.evaluate(test_set)
-    if not errors:
+    if errors.size == 0:
       logger.warning(f"found ZERO objects, num_failed: {num_failed}")
       return
     avg_error = errors.mean(axis=0)
@@ -458,18 +483,16 @@ def main():
   parser.add_argument('commands', nargs='+', help=docs.commands)
 
   # file settings
-  parser.add_argument('--data-root', '--input', '-i', nargs=1,
-                      default=['data/default'],
+  parser.add_argument('--data-root', '--input', '-i', default='data/default',
                       help=docs.data_root)
-  parser.add_argument('--model-root', '--model-dir', '-m', nargs=1,
-                      default=['models/tmp'],
+  parser.add_argument('--model-root', '--model-dir', '-m',
+                      default='models/tmp',
                       help=docs.model_root)
   parser.add_argument('--overwrite', '-f', action='store_true',
                       help=docs.overwrite)
   parser.add_argument('--deep', action='store_true',
                       help=docs.deep)
-  parser.add_argument('--figs-dir', '--figures', nargs=1,
-                      default=['figs'],
+  parser.add_argument('--figs-dir', '--figures', default='figs',
                       help=docs.figs_dir)
 
   # data settings
@@ -478,34 +501,34 @@ def main():
   parser.add_argument('--transformation', '--augment', '-a', nargs='?',
                       default=None, const=0, type=int,
                       help=docs.transformation)
-  parser.add_argument('--identity-prob', nargs=1, default=[0.01], type=float,
+  parser.add_argument('--identity-prob', default=0.01, type=float,
                       help=docs.identity_prob)
-  parser.add_argument('--priority-mode', '--priority', nargs=1,
-                      default=['random'], help=docs.priority_mode)
+  parser.add_argument('--priority-mode', '--priority', default='random',
+                      help=docs.priority_mode)
   parser.add_argument('--labeled', action='store_true', help=docs.labeled)
 
   # annotation settings
-  parser.add_argument('--annotation-mode', '--annotate', nargs=1,
-                      default=['disks'], help=docs.annotation_mode)
-  parser.add_argument('--record-size', nargs=1, default=[10], type=int,
+  parser.add_argument('--annotation-mode', '--annotate', default='disks',
+                      help=docs.annotation_mode)
+  parser.add_argument('--record-size', default=10, type=int,
                       help=docs.record_size)
-  parser.add_argument('--annotation-delay', nargs=1, default=[60], type=float,
+  parser.add_argument('--annotation-delay', default=60, type=float,
                       help=docs.annotation_delay)
 
   # sizes relating to data
   parser.add_argument('--image-shape', '--shape', '-s', nargs=3, type=int,
                       default=[500, 500, 1], help=docs.image_shape)
-  parser.add_argument('--data-size', '-N', nargs=1, default=[10000], type=int,
+  parser.add_argument('--data-size', '-N', default=10000, type=int,
                       help=docs.data_size)
-  parser.add_argument('--test-size', '-T', nargs=1, default=[1000], type=int,
+  parser.add_argument('--test-size', '-T', default=1000, type=int,
                       help=docs.test_size)
-  parser.add_argument('--batch-size', '-b', nargs=1, default=[16], type=int,
+  parser.add_argument('--batch-size', '-b', default=16, type=int,
                       help=docs.batch_size)
-  parser.add_argument('--num-objects', '-n', nargs=1, default=[40], type=int,
+  parser.add_argument('--num-objects', '-n', default=40, type=int,
                       help=docs.num_objects)
-  parser.add_argument('--pose-dim', '-p', nargs=1, default=[2], type=int,
+  parser.add_argument('--pose-dim', '-p', default=2, type=int,
                       help=docs.pose_dim)
-  parser.add_argument('--num-shuffle', nargs=1, default=[1000], type=int,
+  parser.add_argument('--num-shuffle', default=1000, type=int,
                       help=docs.num_shuffle)
 
   # model architecture
@@ -524,25 +547,32 @@ def main():
   parser.add_argument('--use-var', action='store_true', help=docs.use_var)
 
   # model hyperparameters
-  parser.add_argument('--dropout', nargs=1, default=[0.5], type=float,
+  parser.add_argument('--dropout', default=0.5, type=float,
                       help=docs.dropout)
-  parser.add_argument('--initial-epoch', nargs=1, default=[0], type=int,
+  parser.add_argument('--initial-epoch', default=0, type=int,
                       help=docs.initial_epoch)  # todo: get from ckpt
-  parser.add_argument('--epochs', '-e', nargs=1, default=[1], type=int,
+  parser.add_argument('--epochs', '-e', default=1, type=int,
                       help=docs.epochs)
-  parser.add_argument('--learning-rate', '-l', nargs=1, default=[0.1],
+  parser.add_argument('--learning-rate', '-l', default=0.1,
                       type=float, help=docs.learning_rate)
-  parser.add_argument('--tol', nargs=1, default=[0.1], type=float,
+  parser.add_argument('--tol', default=0.1, type=float,
                       help=docs.tol)
 
   # runtime settings
-  parser.add_argument('--num-parallel-calls', '--cores', nargs=1, default=[-1],
+  parser.add_argument('--num-parallel-calls', '--cores', default=-1,
                       type=int, help=docs.num_parallel_calls)
+  parser.add_argument('--prefetch-device', default=None,
+                      help=docs.prefetch_device)
   parser.add_argument('--verbose', '-v', nargs='?', const=1, default=2,
                       type=int, help=docs.verbose)
   parser.add_argument('--keras-verbose', nargs='?', const=2, default=1,
                       type=int, help=docs.keras_verbose)
   parser.add_argument('--patient', action='store_true', help=docs.patient)
+  parser.add_argument('--jit', '--xla', action='store_true', help=docs.jit)
+  parser.add_argument('--mixed-precision', action='store_true',
+                      help=docs.mixed_precision)
+  parser.add_argument('--precision', default='float32',
+                      choices=['float32', 'float16'], help=docs.precision)
   parser.add_argument('--show', action='store_true', help=docs.show)
   parser.add_argument('--cache', action='store_true', help=docs.cache)
   parser.add_argument('--seconds', '--time', '--reload', '-t', '-r', nargs='?',
@@ -552,39 +582,43 @@ def main():
   art = Artifice(commands=args.commands,
                  convert_mode=args.convert_mode,
                  transformation=args.transformation,
-                 identity_prob=args.identity_prob[0],
-                 priority_mode=args.priority_mode[0],
+                 identity_prob=args.identity_prob,
+                 priority_mode=args.priority_mode,
                  labeled=args.labeled,
-                 annotation_mode=args.annotation_mode[0],
-                 record_size=args.record_size[0],
-                 annotation_delay=args.annotation_delay[0],
-                 data_root=args.data_root[0],
-                 model_root=args.model_root[0],
+                 annotation_mode=args.annotation_mode,
+                 record_size=args.record_size,
+                 annotation_delay=args.annotation_delay,
+                 data_root=args.data_root,
+                 model_root=args.model_root,
                  overwrite=args.overwrite,
                  deep=args.deep,
-                 figs_dir=args.figs_dir[0],
+                 figs_dir=args.figs_dir,
                  image_shape=args.image_shape,
-                 data_size=args.data_size[0],
-                 test_size=args.test_size[0],
-                 batch_size=args.batch_size[0],
-                 num_objects=args.num_objects[0],
-                 pose_dim=args.pose_dim[0],
-                 num_shuffle=args.num_shuffle[0],
+                 data_size=args.data_size,
+                 test_size=args.test_size,
+                 batch_size=args.batch_size,
+                 num_objects=args.num_objects,
+                 pose_dim=args.pose_dim,
+                 num_shuffle=args.num_shuffle,
                  base_shape=args.base_shape,
                  level_filters=args.level_filters,
                  level_depth=args.level_depth[0],
                  model=args.model,
                  multiscale=args.multiscale,
                  use_var=args.use_var,
-                 dropout=args.dropout[0],
-                 initial_epoch=args.initial_epoch[0],
-                 epochs=args.epochs[0],
-                 learning_rate=args.learning_rate[0],
-                 tol=args.tol[0],
-                 num_parallel_calls=args.num_parallel_calls[0],
+                 dropout=args.dropout,
+                 initial_epoch=args.initial_epoch,
+                 epochs=args.epochs,
+                 learning_rate=args.learning_rate,
+                 tol=args.tol,
+                 num_parallel_calls=args.num_parallel_calls,
+                 prefetch_device=args.prefetch_device,
                  verbose=args.verbose,
                  keras_verbose=args.keras_verbose,
                  eager=(not args.patient),
+                 jit=args.jit,
+                 mixed_precision=args.mixed_precision,
+                 precision=args.precision,
                  show=args.show,
                  cache=args.cache,
                  seconds=args.seconds)
@@ -2,10 +2,10 @@
 """
 
 import os
-from time import time
+import re
 import itertools
+from collections import deque
 import numpy as np
-from stringcase import snakecase
 import tensorflow as tf
 from tensorflow import keras
 
@@ -15,11 +15,32 @@ from artifice import utils
 from artifice import lay
 
 
-def _get_optimizer(learning_rate):
+def _get_optimizer(learning_rate, mixed_precision=False):
   if tf.executing_eagerly():
-    return tf.train.AdadeltaOptimizer(learning_rate)
+    optimizer = tf.train.AdadeltaOptimizer(learning_rate)
   else:
-    return keras.optimizers.Adadelta(learning_rate)
+    optimizer = keras.optimizers.Adadelta(learning_rate)
+  if not mixed_precision:
+    return optimizer
+  if tf.executing_eagerly():
+    # the rewrite only applies to graphs, eager ops would stay float32
+    logger.warning("mixed precision only applies with --patient (graph "
+                   "mode), training in float32")
+    return optimizer
+  if not hasattr(getattr(tf.train, 'experimental', None),
+                 'enable_mixed_precision_graph_rewrite'):
+    logger.warning("mixed precision requires TensorFlow 1.14 or higher, "
+                   "training in float32")
+    return optimizer
+  # casts to float16 where safe and adds dynamic loss scaling
+  return tf.train.experimental.enable_mixed_precision_graph_rewrite(optimizer)
+
+
+def _trace(fn):
+  """Trace `fn` into a graph function, with tf.function if available."""
+  if hasattr(tf, 'function'):
+    return tf.function(fn)
+  return tf.contrib.eager.defun(fn)
 
 
 def _update_hist(a, b):
@@ -62,17 +83,48 @@ def _unbatch_outputs(outputs):
   return unbatched_outputs
 
 
-def crop(inputs, shape=None, size=None):
-  if size is None:
-    assert shape is not None, 'one of `size` or `shape` must be provided'
-    size = shape[1:3]
-  top_crop = int(np.floor(int(inputs.shape[1] - size[0]) / 2))
-  bottom_crop = int(np.ceil(int(inputs.shape[1] - size[0]) / 2))
-  left_crop = int(np.floor(int(inputs.shape[2] - size[1]) / 2))
-  right_crop = int(np.ceil(int(inputs.shape[2] - size[1]) / 2))
-  outputs = keras.layers.Cropping2D(cropping=((top_crop, bottom_crop),
-                                              (left_crop, right_crop)),
-                                    input_shape=inputs.shape)(inputs)
+def _popleft(queue, n):
+  """Pop the first `n` elements off of a deque.
+
+  :param queue: deque with at least `n` elements
+  :param n: number of elements to pop
+  :returns: list of the popped elements, in order
+  :rtype: list
+
+  """
+  return [queue.popleft() for _ in range(n)]
+
+
+def _crop_offsets(shape, size):
+  """Compute the (top, bottom, left, right) crop centering size in shape."""
+  dh = int(shape[0]) - int(size[0])
+  dw = int(shape[1]) - int(size[1])
+  return dh // 2, dh - dh // 2, dw // 2, dw - dw // 2
+
+
+def crop(inputs, shape=None, size=None, offsets=None):
+  """Center-crop the height and width of inputs.
+
+  :param inputs:
+  :param shape: shape to crop to, including the batch dimension
+  :param size: height, width to crop to
+  :param offsets: precomputed `(top, bottom, left, right)` crop, used instead
+  of `shape` or `size` if provided
+  :returns:
+  :rtype:
+
+  """
+  if offsets is None:
+    if size is None:
+      assert shape is not None, 'one of `size` or `shape` must be provided'
+      size = shape[1:3]
+    offsets = _crop_offsets(inputs.shape[1:3], size)
+  top_crop, bottom_crop, left_crop, right_crop = offsets
+  height = int(inputs.shape[1]) - top_crop - bottom_crop
+  width = int(inputs.shape[2]) - left_crop - right_crop
+  outputs = keras.layers.Lambda(
+    lambda x: x[:, top_crop:top_crop + height, left_crop:left_crop + width, :]
+  )(inputs)
   return outputs
 
 
@@ -91,14 +143,9 @@ def _crop_like_conv(inputs,
   assert padding in {'same', 'valid'}
   if padding == 'same':
     return inputs
-  top_crop = kernel_size[0] // 2
-  bottom_crop = (kernel_size[0] - 1) // 2
-  left_crop = kernel_size[1] // 2
-  right_crop = (kernel_size[1] - 1) // 2
-  outputs = keras.layers.Cropping2D(cropping=((top_crop, bottom_crop),
-                                              (left_crop, right_crop)),
-                                    input_shape=inputs.shape)(inputs)
-  return outputs
+  offsets = (kernel_size[0] // 2, (kernel_size[0] - 1) // 2,
+             kernel_size[1] // 2, (kernel_size[1] - 1) // 2)
+  return crop(inputs, offsets=offsets)
 
 
 def conv(inputs,
@@ -201,6 +248,46 @@ def conv_upsample(inputs,
   return inputs
 
 
+def _fold_batch_norm(conv_layer, norm_layer):
+  """Fold a frozen batch normalization into the weights of the preceding conv.
+
+  With `s = gamma / sqrt(var + eps)`, the normalized output `s * (Wx + b -
+  mean) + beta` is the same as a convolution with kernel `s * W` and bias `s *
+  (b - mean) + beta`.
+
+  :param conv_layer: Conv2D layer, without activation
+  :param norm_layer: BatchNormalization layer applied to the conv's output
+  :returns: `[kernel, bias]` weights for an equivalent Conv2D with a bias
+  :rtype: list
+
+  """
+  weights = conv_layer.get_weights()
+  kernel = weights[0]
+  bias = weights[1] if conv_layer.use_bias else 0
+  gamma, beta, mean, variance = norm_layer.get_weights()
+  scale = gamma / np.sqrt(variance + norm_layer.epsilon)
+  return [kernel * scale, (bias - mean) * scale + beta]
+
+
+def _foldable(layer):
+  """Whether `layer` is a BatchNormalization that can be folded into its input.
+
+  :param layer: keras layer
+  :returns: the Conv2D layer that `layer` normalizes, or None
+
+  """
+  if (not isinstance(layer, keras.layers.BatchNormalization)
+      or not (layer.center and layer.scale)
+      or utils.listwrap(layer.axis) not in [[-1], [3]]):
+    return None
+  conv_layer = utils.listwrap(layer._inbound_nodes[0].inbound_layers)[0]
+  if (type(conv_layer) is not keras.layers.Conv2D
+      or conv_layer.get_config()['activation'] != 'linear'
+      or len(conv_layer._outbound_nodes) != 1):
+    return None
+  return conv_layer
+
+
 def upsample(inputs, size=2, interpolation='nearest'):
   """Upsamples the inputs by `size`, using interpolation.
 
@@ -233,8 +320,11 @@ class ArtificeModel(metaclass=Builder):
 
   """
 
+  # float types that the layers can be built in, see `cast`
+  float_types = ('float32', 'float16')
+
   def __init__(self, input_shape, model_dir='.', learning_rate=0.1,
-               overwrite=False):
+               overwrite=False, mixed_precision=False, batch_size=None):
     """Describe a model using keras' functional API.
 
     Compiles model here, so all other instantiation should be finished.
@@ -249,24 +339,38 @@ class ArtificeModel(metaclass=Builder):
     loaded architecture may differ from the stated architecture in the
     subclass, although the structure of the saved model names should prevent
     this.
+    :param mixed_precision: train with float16 activations where safe, using
+    the mixed precision graph rewrite (TensorFlow 1.14 or higher). Only takes
+    effect in graph mode.
+    :param batch_size: fix the batch dimension of the model inputs, so that
+    every op has a static shape and XLA compiles the graph only once. The model
+    can then only be run on batches of exactly this size.
 
     """
     self.input_shape = input_shape
     self.overwrite = overwrite
     self.model_dir = model_dir
     self.learning_rate = learning_rate
-    self.name = snakecase(type(self).__name__).lower()
+    self.mixed_precision = mixed_precision
+    self.batch_size = batch_size
+    self.fused = False
+    self._unfused_model = None
+    self._predict_fn = None
+    self.name = re.sub(r'(?<!^)(?=[A-Z])', '_', type(self).__name__).lower()
     self.model_path = os.path.join(self.model_dir, f"{self.name}.hdf5")
-    self.checkpoint_path = os.path.join(
-      self.model_dir, f"{self.name}_ckpt.hdf5")
+    self.checkpoint_path = os.path.join(self.model_dir, f"{self.name}_ckpt")
+    self.legacy_checkpoint_path = self.checkpoint_path + '.hdf5'
     self.history_path = os.path.join(
       self.model_dir, f"{self.name}_history.json")
+    self.checkpoint_callback = keras.callbacks.ModelCheckpoint(
+      self.checkpoint_path, verbose=1, save_weights_only=True)
 
   def build(self):
     """Called after all subclasses have finished __init__()"""
-    inputs = keras.layers.Input(self.input_shape)
+    inputs = keras.layers.Input(self.input_shape, batch_size=self.batch_size)
     outputs = self.forward(inputs)
     self.model = keras.Model(inputs, outputs)
+    self._predict_fn = None
     self.compile()
 
     if not self.overwrite:
@@ -291,24 +395,148 @@ class ArtificeModel(metaclass=Builder):
 
   @property
   def callbacks(self):
-    return [keras.callbacks.ModelCheckpoint(
-      self.checkpoint_path, verbose=1, save_weights_only=True)]
+    return [self.checkpoint_callback]
 
   def load_weights(self, checkpoint_path=None):
     """Update the model weights from the chekpoint file.
 
+    Checkpoints are written in the TensorFlow format, which saves the weight
+    tensors directly rather than serializing them through HDF5. Paths ending
+    in .h5 or .hdf5 are loaded as HDF5, by layer name.
+
     :param checkpoint_path: checkpoint path to use. If not provided, uses the
-    class name to construct a checkpoint path.
+    class name to construct a checkpoint path, falling back to an HDF5
+    checkpoint from older versions if there is no TensorFlow checkpoint.
 
     """
     if checkpoint_path is None:
       checkpoint_path = self.checkpoint_path
-    if os.path.exists(checkpoint_path):
-      self.model.load_weights(checkpoint_path, by_name=True)  # todo: by_name?
+      if (not os.path.exists(checkpoint_path + '.index')
+          and os.path.exists(self.legacy_checkpoint_path)):
+        checkpoint_path = self.legacy_checkpoint_path
+
+    hdf5 = checkpoint_path.endswith(('.h5', '.hdf5'))
+    if os.path.exists(checkpoint_path if hdf5 else checkpoint_path + '.index'):
+      # by_name is only supported for HDF5
+      self.model.load_weights(checkpoint_path, by_name=hdf5)
       logger.info(f"loaded model weights from {checkpoint_path}")
     else:
       logger.info(f"no checkpoint at {checkpoint_path}")
 
+  def fuse_batch_norm(self):
+    """Fold every BatchNormalization into the Conv2D before it, for inference.
+
+    Rebuilds `self.model` from the same layers, replacing each Conv2D that
+    feeds a batch norm with an equivalent Conv2D with a bias and dropping the
+    batch norm, which saves a full pass over its activations. The fused model
+    should not be trained or saved, and it cannot load the unfused weights, so
+    call `unfuse_batch_norm` to restore the original model afterward.
+
+    """
+    if self.fused:
+      return
+    convs = {}                  # norm layer -> conv layer
+    for layer in self.model.layers:
+      conv_layer = _foldable(layer)
+      if conv_layer is not None:
+        convs[layer] = conv_layer
+    fused_weights = dict((conv_layer, _fold_batch_norm(conv_layer, norm_layer))
+                         for norm_layer, conv_layer in convs.items())
+
+    tensors = dict((id(t), t) for t in self.model.inputs)
+    for layer in self.model.layers:
+      if isinstance(layer, keras.layers.InputLayer):
+        continue
+      node = layer._inbound_nodes[0]
+      inputs = [tensors[id(t)] for t in node.input_tensors]
+      inputs = inputs[0] if len(inputs) == 1 else inputs
+      if layer in convs:
+        outputs = inputs
+      elif layer in fused_weights:
+        config = layer.get_config()
+        config['use_bias'] = True
+        fused_layer = keras.layers.Conv2D.from_config(config)
+        outputs = fused_layer(inputs)
+        fused_layer.set_weights(fused_weights[layer])
+      else:
+        outputs = layer(inputs)
+      for t, output in zip(node.output_tensors, utils.listwrap(outputs)):
+        tensors[id(t)] = output
+
+    outputs = [tensors[id(t)] for t in self.model.outputs]
+    self._unfused_model = self.model
+    self.model = keras.Model(self.model.inputs, outputs)
+    self._predict_fn = None
+    self.compile()
+    self.fused = True
+    logger.info(f"fused {len(convs)} batch norm layers into convolutions")
+
+  def unfuse_batch_norm(self):
+    """Restore the model from before `fuse_batch_norm`, if it was fused.
+
+    Layers other than the fused convolutions are shared between the two models,
+    so the original model is unchanged by running the fused one.
+
+    """
+    if not self.fused:
+      return
+    self.model = self._unfused_model
+    self._unfused_model = None
+    self._predict_fn = None
+    self.fused = False
+
+  def predict_on_batch(self, inputs):
+    """Run the model on a single batch, in inference mode.
+
+    When executing eagerly, the model call is traced into a graph function the
+    first time, and that function is reused for every later batch, skipping
+    the per-call overhead of `keras.Model.predict_on_batch`.
+
+    :param inputs: batch of input tiles
+    :returns: list of numpy outputs, one for each model output
+    :rtype: list
+
+    """
+    if not tf.executing_eagerly():
+      return [np.asarray(output, np.float32) for output in
+              utils.listwrap(self.model.predict_on_batch(inputs))]
+    if self._predict_fn is None:
+      model = self.model
+      self._predict_fn = _trace(lambda x: model(x, training=False))
+    outputs = self._predict_fn(tf.cast(inputs, self.model.inputs[0].dtype))
+    return [output.numpy().astype(np.float32, copy=False)
+            for output in utils.listwrap(outputs)]
+
+  def cast(self, dtype):
+    """Rebuild the model in `dtype`, such as 'float16', for inference only.
+
+    All layers are rebuilt with `dtype` as the keras float type and given the
+    current weights, cast to `dtype`. Outputs of `predict_on_batch` are still
+    float32. The cast model should not be trained or saved.
+
+    :param dtype: float type name, one of `float_types`
+
+    """
+    if dtype not in self.float_types:
+      raise NotImplementedError(
+        f"{type(self).__name__} only supports {', '.join(self.float_types)}, "
+        f"not {dtype}")
+    if dtype == self.model.inputs[0].dtype:
+      return
+    self.unfuse_batch_norm()    # rebuilt from forward(), which isn't fused
+    weights = self.model.get_weights()
+    floatx = keras.backend.floatx()
+    keras.backend.set_floatx(dtype)
+    try:
+      inputs = keras.layers.Input(self.input_shape, batch_size=self.batch_size)
+      model = keras.Model(inputs, self.forward(inputs))
+    finally:
+      keras.backend.set_floatx(floatx)
+    model.set_weights([w.astype(dtype) for w in weights])
+    self.model = model
+    self._predict_fn = None
+    logger.info(f"cast model to {dtype}")
+
   def save(self, filename=None, overwrite=True):
     if filename is None:
       filename = self.model_path
@@ -318,19 +546,24 @@ class ArtificeModel(metaclass=Builder):
   # found in keras library. Look into it during training. For now, we're fine
   # with just weights in the checkpoint file.
 
-  def fit(self, art_data, hist=None, cache=False, **kwargs):
+  def fit(self, art_data, hist=None, cache=False, initial_epoch=0, epochs=1,
+          **kwargs):
     """Thin wrapper around model.fit(). Preferred method is `train()`.
 
     :param art_data:
     :param hist: existing hist. If None, starts from scratch. Use train for
     loading from existing hist.
     :param cache: cache the dataset.
+    :param initial_epoch: epoch that training is starting from
+    :param epochs: epoch number to stop at
     :returns:
     :rtype:
 
     """
     kwargs['callbacks'] = kwargs.get('callbacks', []) + self.callbacks
     new_hist = self.model.fit(art_data.training_input(cache=cache),
+                              initial_epoch=initial_epoch,
+                              epochs=epochs,
                               steps_per_epoch=art_data.steps_per_epoch,
                               **kwargs).history
     new_hist = utils.jsonable(new_hist)
@@ -340,15 +573,16 @@ class ArtificeModel(metaclass=Builder):
 
     return new_hist
 
-  def train(self, art_data, initial_epoch=0, epochs=1, seconds=0,
-            **kwargs):
-    """Fits the model, saving it along the way, and reloads every epoch.
+  def train(self, art_data, initial_epoch=0, epochs=1, **kwargs):
+    """Fits the model, saving it along the way.
+
+    Training is a single call to `fit()`. New records written to the
+    directories of `art_data` are picked up each time the dataset is repeated,
+    without reloading it, unless the dataset is cached.
 
     :param art_data: ArtificeData set
     :param initial_epoch: epoch that training is starting from
     :param epochs: epoch number to stop at. If -1, training continues forever.
-    :param seconds: seconds after which to stop reloading every epoch. If -1,
-    reload is never stopped. If 0, dataset is loaded only once, at beginning.
     :returns: history dictionary
 
     """
@@ -359,17 +593,10 @@ class ArtificeModel(metaclass=Builder):
     else:
       hist = {}
 
-    start_time = time()
-    epoch = initial_epoch
-
-    while epoch != epochs and time() - start_time > seconds > 0:
-      logger.info("reloading dataset (not cached)...")
-      hist = self.fit(art_data, hist=hist, initial_epoch=epoch,
-                      epochs=(epoch + 1), **kwargs)
-      epoch += 1
-
-    if epoch != epochs:
-      hist = self.fit(art_data, hist=hist, initial_epoch=epoch,
+    if epochs < 0:
+      epochs = np.iinfo(np.int32).max
+    if initial_epoch < epochs:
+      hist = self.fit(art_data, hist=hist, initial_epoch=initial_epoch,
                       epochs=epochs, **kwargs)
 
     self.save()
@@ -462,6 +689,8 @@ class UNet(ArtificeModel):
     self.input_tile_shape = self.compute_input_tile_shape()
     self.output_tile_shapes = self.compute_output_tile_shapes()
     self.output_tile_shape = self.output_tile_shapes[-1]
+    self.crop_offsets = self.compute_crop_offsets_(
+      self.base_shape, self.num_levels, self.level_depth)
 
     super().__init__(self.input_tile_shape + [self.num_channels], **kwargs)
 
@@ -527,6 +756,28 @@ class UNet(ArtificeModel):
       tile_shape -= 2 * level_depth
     return shapes
 
+  @staticmethod
+  def compute_crop_offsets_(base_shape, num_levels, level_depth):
+    """Compute the crop of the skip connection at every level but the lowest.
+
+    :returns: `(top, bottom, left, right)` offsets, bottom to top, starting
+    with the level above the lowest one.
+    :rtype: list
+
+    """
+    skip_shapes = []
+    tile_shape = np.array(UNet.compute_input_tile_shape_(
+      base_shape, num_levels, level_depth))
+    for _ in range(num_levels - 1):
+      tile_shape -= 2 * level_depth
+      skip_shapes.append(list(tile_shape))
+      tile_shape //= 2
+    level_input_shapes = UNet.compute_level_input_shapes_(
+      base_shape, num_levels, level_depth)[1:]
+    return [_crop_offsets(skip_shape, level_input_shape)
+            for skip_shape, level_input_shape
+            in zip(reversed(skip_shapes), level_input_shapes)]
+
   def _fix_level_index(self, level):
     if level >= 0:
       return level
@@ -567,33 +818,48 @@ class UNet(ArtificeModel):
 
   @staticmethod
   def pose_loss(pose, pred):
-    return tf.losses.mean_squared_error(pose[:, :, :, 1:],
-                                        pred[:, :, :, 1:],
-                                        weights=pose[:, :, :, :1])
+    """Mean squared error on the pose, weighted by the distance proxy.
+
+    The proxy is strictly positive, so this matches
+    `tf.losses.mean_squared_error` with `weights=pose[:, :, :, :1]`, as a
+    single elementwise expression rather than a weighted-loss subgraph.
+
+    """
+    return tf.reduce_mean(
+      pose[:, :, :, :1] * tf.square(pose[:, :, :, 1:] - pred[:, :, :, 1:]))
 
   def compile(self):
-    optimizer = _get_optimizer(self.learning_rate)
+    optimizer = _get_optimizer(self.learning_rate,
+                               mixed_precision=self.mixed_precision)
     self.model.compile(optimizer=optimizer, loss=[self.pose_loss]
                        + ['mse'] * self.num_levels)
 
-  def forward(self, inputs):
-    level_outputs = []
-    outputs = []
+  def encode(self, inputs):
+    """Run the contracting half of the U, down to the lowest level.
 
+    :param inputs: input tensor
+    :returns: `(inputs, level_outputs)`, the output of the lowest level and the
+    outputs of every level above it, top to bottom, for the skip connections.
+    :rtype: tuple
+
+    """
+    level_outputs = []
     for level, filters in enumerate(reversed(self.level_filters)):
       for _ in range(self.level_depth):
         inputs = conv(inputs, filters)
       if level < self.num_levels - 1:
         level_outputs.append(inputs)
         inputs = keras.layers.MaxPool2D()(inputs)
-      else:
-        outputs.append(conv(inputs, 1, kernel_shape=[1, 1], activation=None,
-                            norm=False, name='output_0'))
+    return inputs, level_outputs
+
+  def forward(self, inputs):
+    inputs, level_outputs = self.encode(inputs)
+    outputs = [conv(inputs, 1, kernel_shape=[1, 1], activation=None,
+                    norm=False, name='output_0')]
 
-    level_outputs = reversed(level_outputs)
     for i, filters in enumerate(self.level_filters[1:]):
       inputs = conv_upsample(inputs, filters)
-      cropped = crop(next(level_outputs), inputs.shape)
+      cropped = crop(level_outputs[-(i + 1)], offsets=self.crop_offsets[i])
       dropped = keras.layers.Dropout(rate=self.dropout)(cropped)
       inputs = keras.layers.Concatenate()([dropped, inputs])
       for _ in range(self.level_depth):
@@ -615,19 +881,20 @@ class UNet(ArtificeModel):
   def predict(self, art_data, multiscale=False):
     """Run prediction, reassembling tiles, with the Artifice data."""
     if tf.executing_eagerly():
-      outputs = []
+      outputs = deque()
       for i, batch in enumerate(art_data.prediction_input()):
         if i % 100 == 0:
           logger.info(f"batch {i} / {art_data.steps_per_epoch}")
-          outputs += _unbatch_outputs(self.model.predict_on_batch(batch))
+        outputs.extend(_unbatch_outputs(self.predict_on_batch(batch)))
         while len(outputs) >= art_data.num_tiles:
-          prediction = art_data.analyze_outputs(outputs, multiscale=multiscale)
+          prediction = art_data.analyze_outputs(
+            _popleft(outputs, art_data.num_tiles), multiscale=multiscale)
           yield prediction
-          del outputs[:art_data.num_tiles]
+      return
     else:
       raise NotImplementedError(
         "enable eager execution for eval (remove --patient)")
-    outputs = []
+    outputs = deque()
     next_batch = (art_data
                   .prediction_input()
                   .make_one_shot_iterator()
@@ -641,33 +908,30 @@ class UNet(ArtificeModel):
           return
         if i % 100 == 0:
           logger.info(f"batch {i} / {art_data.steps_per_epoch}")
-          outputs += _unbatch_outputs(self.model.predict_on_batch(batch))
+        outputs.extend(_unbatch_outputs(self.predict_on_batch(batch)))
         while len(outputs) >= art_data.num_tiles:
           prediction = art_data.analyze_outputs(
-            outputs, multiscale=multiscale)
+            _popleft(outputs, art_data.num_tiles), multiscale=multiscale)
           yield prediction
-          del outputs[:art_data.num_tiles]
 
   def predict_visualization(self, art_data):
     """Run prediction, reassembling tiles, with the Artifice data."""
     if tf.executing_eagerly():
-      tiles = []
-      dist_tiles = []
-      outputs = []
+      tiles = deque()
+      outputs = deque()
       p = art_data.image_padding()
       for batch in art_data.prediction_input():
-        tiles += [tile[p[0][0]:, p[1][0]:] for tile in list(batch)]
-        new_outputs = _unbatch_outputs(self.model.predict_on_batch(batch))
-        outputs += new_outputs
-        dist_tiles += [output[-1] for output in new_outputs]
+        tiles.extend(tile[p[0][0]:, p[1][0]:] for tile in list(batch))
+        outputs.extend(_unbatch_outputs(self.predict_on_batch(batch)))
         while len(outputs) >= art_data.num_tiles:
-          image = art_data.untile(tiles[:art_data.num_tiles])
-          dist_image = art_data.untile(dist_tiles[:art_data.num_tiles])
-          prediction = art_data.analyze_outputs(outputs)
+          image = art_data.untile(_popleft(tiles, art_data.num_tiles))
+          tiled_outputs = [np.stack(output) for output in zip(
+            *_popleft(outputs, art_data.num_tiles))]
+          # untile the distance channel once, for both display and peaks
+          dist_image = art_data.untile(tiled_outputs[-1][:, :, :, 0])
+          prediction = art_data.analyze_tiled_outputs(
+            tiled_outputs, dist_image=dist_image)
           yield (image, dist_image, prediction)
-          del outputs[:art_data.num_tiles]
-          del tiles[:art_data.num_tiles]
-          del dist_tiles[:art_data.num_tiles]
     else:
       raise NotImplementedError("patient prediction")
 
@@ -676,62 +940,102 @@ class UNet(ArtificeModel):
     num_tiles = art_data.num_tiles
     art_data.num_tiles = 1
     if tf.executing_eagerly():
-      tiles = []
-      outputs = []
+      tiles = deque()
+      outputs = deque()
       p = art_data.image_padding()
       for batch in art_data.prediction_input():
-        tiles += [tile[p[0][0]:, p[1][0]:] for tile in list(batch)]
-        outputs += _unbatch_outputs(self.model.predict_on_batch(batch))
+        tiles.extend(tile[p[0][0]:, p[1][0]:] for tile in list(batch))
+        outputs.extend(_unbatch_outputs(self.predict_on_batch(batch)))
         while outputs:
-          tile = art_data.untile(tiles[:1])
-          yield (tile, outputs[0])  # todo: del line
-          del outputs[0]
-          del tiles[0]
+          tile = art_data.untile([tiles.popleft()])
+          yield (tile, outputs.popleft())
     else:
       raise NotImplementedError("patient prediction")
     art_data.num_tiles = num_tiles
 
   def evaluate(self, art_data, multiscale=False):
-    """Runs evaluation for UNet."""
-    if tf.executing_eagerly():
-      tile_labels = []
-      errors = []
-      outputs = []
-      total_num_failed = 0
-      for i, (batch_tiles, batch_labels) in enumerate(
-              art_data.evaluation_input()):
-        if i % 10 == 0:
-          logger.info(f"evaluating batch {i} / {art_data.steps_per_epoch}")
-          tile_labels += list(batch_labels)
-          outputs += _unbatch_outputs(self.model.predict_on_batch(batch_tiles))
-        while len(outputs) >= art_data.num_tiles:
-          label = art_data.untile_points(tile_labels[:art_data.num_tiles])
-          prediction = art_data.analyze_outputs(outputs, multiscale=multiscale)
-          error, num_failed = dat.evaluate_prediction(label, prediction)
-          total_num_failed += num_failed
-          errors += error[error[:, 0] >= 0].tolist()
-          del tile_labels[:art_data.num_tiles]
-          del outputs[:art_data.num_tiles]
-    else:
+    """Runs evaluation for UNet.
+
+    Outputs and labels are written straight into preallocated buffers, with
+    room for the tiles of one image plus one batch, and drained an image at a
+    time. Batch norms are fused for the evaluation only, unless the model was
+    already fused.
+
+    """
+    if not tf.executing_eagerly():
       raise NotImplementedError("evaluation on patient execution")
-    return np.array(errors), total_num_failed
+    if self.fused:
+      return self._evaluate(art_data, multiscale=multiscale)
+    self.fuse_batch_norm()
+    try:
+      return self._evaluate(art_data, multiscale=multiscale)
+    finally:
+      self.unfuse_batch_norm()
+
+  def _evaluate(self, art_data, multiscale=False):
+    num_tiles = art_data.num_tiles
+    capacity = num_tiles + art_data.batch_size
+    output_bufs = label_buf = None
+    size = 0                    # number of tiles in the buffers
+    errors = []
+    total_num_failed = 0
+    for i, (batch_tiles, batch_labels) in enumerate(
+            art_data.evaluation_input()):
+      if i % 10 == 0:
+        logger.info(f"evaluating batch {i} / {art_data.steps_per_epoch}")
+      batch_outputs = self.predict_on_batch(batch_tiles)
+      batch_labels = batch_labels.numpy()
+      if output_bufs is None:
+        output_bufs = [np.empty((capacity,) + output.shape[1:], np.float32)
+                       for output in batch_outputs]
+        label_buf = np.empty((capacity,) + batch_labels.shape[1:], np.float32)
+      n = batch_labels.shape[0]
+      for buf, output in zip(output_bufs, batch_outputs):
+        buf[size:size + n] = output
+      label_buf[size:size + n] = batch_labels
+      size += n
+
+      start = 0
+      while size - start >= num_tiles:
+        end = start + num_tiles
+        label = art_data.untile_points(label_buf[start:end])
+        prediction = art_data.analyze_tiled_outputs(
+          [buf[start:end] for buf in output_bufs], multiscale=multiscale)
+        error, num_failed = dat.evaluate_prediction(label, prediction)
+        total_num_failed += num_failed
+        errors.append(error[error[:, 0] >= 0])
+        start = end
+
+      # move the tiles of the next, unfinished image to the front
+      for buf in output_bufs + [label_buf]:
+        buf[:size - start] = buf[start:size]
+      size -= start
+
+    if not errors:
+      return np.empty((0, 0), np.float32), total_num_failed
+    return np.concatenate(errors), total_num_failed
 
   def uncertainty_on_batch(self, images):
     """Estimate the model's uncertainty for each image."""
-    batch_outputs = _unbatch_outputs(self.model.predict_on_batch(images))
-    confidences = np.empty(len(batch_outputs), np.float32)
-    for i, outputs in enumerate(batch_outputs):
-      detections = dat.multiscale_detect_peaks(outputs[1:])
-      confidences[i] = np.mean([outputs[0][x, y] for x, y in detections])
-    return 1 - confidences
+    outputs = self.predict_on_batch(images)
+    indices, counts = dat.multiscale_detect_peaks_batch(outputs[1:])
+    values = outputs[0][indices[:, 0], indices[:, 1], indices[:, 2]]
+    sums = np.bincount(indices[:, 0], weights=values.sum(axis=-1),
+                       minlength=counts.shape[0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+      confidences = sums / (counts * outputs[0].shape[-1])
+    return 1 - confidences.astype(np.float32)
 
 
 class SparseUNet(UNet):
-  def __init__(self, *, batch_size=None, block_size=[8, 8], tol=0.5, **kwargs):
+  # the sparse layers gather and scatter into float32 buffers
+  float_types = ('float32',)
+
+  def __init__(self, *, use_var=False, block_size=[8, 8], tol=0.5, **kwargs):
     """Create a UNet-like architecture using multi-scale tracking.
 
-    :param batch_size: determines whether variables will be used in sparse
-    layers for the scatter operation.
+    :param use_var: use variables in sparse layers for the scatter operation.
+    Requires `batch_size`.
     :param block_size: width/height of the blocks used for sparsity, at the
     scale of the original resolution (resized at each level. These are rescaled
     at each level.
@@ -742,42 +1046,32 @@ class SparseUNet(UNet):
 
     """
     super().__init__(**kwargs)
-    self.batch_size = batch_size
+    self.use_var = use_var
     self.block_size = utils.listify(block_size, 2)
     self.tol = tol
 
   def forward(self, inputs):
-    if self.batch_size is not None:
-      inputs.set_shape([self.batch_size] + list(inputs.shape)[1:])
+    batch_size = self.batch_size if self.use_var else None
 
-    level_outputs = []
-    outputs = []
-    for level, filters in enumerate(reversed(self.level_filters)):
-      for _ in range(self.level_depth):
-        inputs = conv(inputs, filters)
-      if level < self.num_levels - 1:
-        level_outputs.append(inputs)
-        inputs = keras.layers.MaxPool2D()(inputs)
-      else:
-        mask = conv(inputs, 1, kernel_shape=[1, 1], activation=None,
-                    norm=False, name='output_0')
-        outputs.append(mask)
+    inputs, level_outputs = self.encode(inputs)
+    mask = conv(inputs, 1, kernel_shape=[1, 1], activation=None,
+                norm=False, name='output_0')
+    outputs = [mask]
 
-    level_outputs = reversed(level_outputs)
     for i, filters in enumerate(self.level_filters[1:]):
       inputs = conv_upsample(inputs, filters, mask=mask, tol=self.tol,
                              block_size=self.block_size,
-                             batch_size=self.batch_size)
+                             batch_size=batch_size)
       mask = upsample(mask, size=2, interpolation='nearest')
 
-      cropped = crop(next(level_outputs), inputs.shape)
+      cropped = crop(level_outputs[-(i + 1)], offsets=self.crop_offsets[i])
       dropped = keras.layers.Dropout(rate=self.dropout)(cropped)
       inputs = keras.layers.Concatenate()([dropped, inputs])
 
       for _ in range(self.level_depth):
         inputs = conv(inputs, filters, mask=mask, tol=self.tol,
                       block_size=self.block_size,
-                      batch_size=self.batch_size)
+                      batch_size=batch_size)
         mask = _crop_like_conv(mask)
       mask = conv(
         inputs,
@@ -789,7 +1083,7 @@ class SparseUNet(UNet):
         mask=mask,
         tol=self.tol,
         block_size=self.block_size,
-        batch_size=self.batch_size,
+        batch_size=batch_size,
         name=f'output_{i+1}')
       outputs.append(mask)
 
@@ -803,7 +1097,7 @@ class SparseUNet(UNet):
       mask=mask,
       block_size=self.block_size,
       tol=self.tol,
-      batch_size=self.batch_size,
+      batch_size=batch_size,
       name='pose')
 
     outputs = [pose_image] + outputs
@@ -859,18 +1153,10 @@ class BetterSparseUNet(SparseUNet):
     return strides
 
   def forward(self, inputs):
-    level_outputs = []
-    outputs = []
-    for level, filters in enumerate(reversed(self.level_filters)):
-      for _ in range(self.level_depth):
-        inputs = conv(inputs, filters)
-      if level < self.num_levels - 1:
-        level_outputs.append(inputs)
-        inputs = keras.layers.MaxPool2D()(inputs)
-      else:
-        mask = conv(inputs, 1, kernel_shape=[1, 1], activation=None,
-                    norm=False, name='output_0')
-        outputs.append(mask)
+    inputs, level_outputs = self.encode(inputs)
+    mask = conv(inputs, 1, kernel_shape=[1, 1], activation=None,
+                norm=False, name='output_0')
+    outputs = [mask]
 
     # sparsify based on the first mask
     bin_counts, active_block_indices = lay.ReduceMask(
@@ -878,7 +1164,6 @@ class BetterSparseUNet(SparseUNet):
       block_stride=self.block_stride,
       tol=self.tol)(mask)
 
-    level_outputs = reversed(level_outputs)
     for i, filters in enumerate(self.level_filters[1:]):
       level = i + 1
       blocks = lay.SparseGather(
@@ -887,8 +1172,8 @@ class BetterSparseUNet(SparseUNet):
           [inputs, bin_counts, active_block_indices])
       blocks = conv_upsample(blocks, filters)
 
-      level_output = next(level_outputs)
-      cropped = crop(level_output, size=self.level_input_tile_sizes[level])
+      level_output = level_outputs[-level]
+      cropped = crop(level_output, offsets=self.crop_offsets[i])
       dropped = keras.layers.Dropout(rate=self.dropout)(cropped)
       blocked = lay.SparseGather(
         block_size=self.level_input_block_size,
@@ -986,7 +1271,8 @@ class AutoSparseUNet(BetterSparseUNet):
     return tf.norm(mask, ord=2) / tf.norm(mask, ord=1)
 
   def compile(self):
-    optimizer = _get_optimizer(self.learning_rate)
+    optimizer = _get_optimizer(self.learning_rate,
+                               mixed_precision=self.mixed_precision)
     self.model.compile(
       optimizer=optimizer,
       loss=[self.pose_loss] + [self.sparsity_loss] * self.num_levels,
@@ -994,22 +1280,14 @@ class AutoSparseUNet(BetterSparseUNet):
 
   # todo: resolve similarities between this and other forward functions
   def forward(self, inputs):
-    level_outputs = []
-    outputs = []
-    for level, filters in enumerate(reversed(self.level_filters)):
-      for _ in range(self.level_depth):
-        inputs = conv(inputs, filters)
-      if level < self.num_levels - 1:
-        level_outputs.append(inputs)
-        inputs = keras.layers.MaxPool2D()(inputs)
-      else:
-        mask = conv(inputs,
-                    1,
-                    kernel_shape=[1, 1],
-                    activation='relu',
-                    norm=False,
-                    activation_name=f'output_0')
-        outputs.append(mask)
+    inputs, level_outputs = self.encode(inputs)
+    mask = conv(inputs,
+                1,
+                kernel_shape=[1, 1],
+                activation='relu',
+                norm=False,
+                activation_name=f'output_0')
+    outputs = [mask]
 
     # sparsify based on the first mask
     bin_counts, active_block_indices = lay.ReduceMask(
@@ -1017,7 +1295,6 @@ class AutoSparseUNet(BetterSparseUNet):
       block_stride=self.block_stride,
       tol=self.tol)(mask)
 
-    level_outputs = reversed(level_outputs)
     for i, filters in enumerate(self.level_filters[1:]):
       level = i + 1
       blocks = lay.SparseGather(
@@ -1026,8 +1303,8 @@ class AutoSparseUNet(BetterSparseUNet):
           [inputs, bin_counts, active_block_indices])
       blocks = conv_upsample(blocks, filters)
 
-      level_output = next(level_outputs)
-      cropped = crop(level_output, size=self.level_input_tile_sizes[level])
+      level_output = level_outputs[-level]
+      cropped = crop(level_output, offsets=self.crop_offsets[i])
       dropped = keras.layers.Dropout(rate=self.dropout)(cropped)
       blocked = lay.SparseGather(
         block_size=self.level_input_block_size,
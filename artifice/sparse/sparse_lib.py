@@ -219,11 +219,10 @@ def scatter(
         add=False):
   """Scatter the blocks back onto outputs.
 
-  Note that currently this only uses `outputs.shape` to scatter onto a tensor
-  of zeros.
-
-  In tf >= 1.14, the functions tf.tensor_scatter_nd_update and
-  tf.tensor_scatter_nd_add would overcome this barrier.
+  In tf >= 1.14, uses tf.tensor_scatter_nd_update (or tf.tensor_scatter_nd_add
+  if `add`) to scatter onto `outputs` itself, with no Variable. Older versions
+  only use `outputs.shape` to scatter onto a tensor of zeros, and do not
+  support `add`.
 
   :param blocks: [M, bsize[0], bsize[1], C]
   :param bin_counts:
@@ -246,7 +245,12 @@ def scatter(
     boffset,
     bstride)                    # [M, bsize[0], bsize[1], 3]
 
-  if add:
+  if hasattr(tf, 'tensor_scatter_nd_update'):
+    if add:
+      outputs = tf.tensor_scatter_nd_add(outputs, indices, blocks)
+    else:
+      outputs = tf.tensor_scatter_nd_update(outputs, indices, blocks)
+  elif add:
     raise NotImplementedError
   else:
     outputs = tf.case(
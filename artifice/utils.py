@@ -12,6 +12,18 @@ def divup(a, b):
   return (a + b - 1) // b
 
 
+def available_cpus():
+  """Number of CPUs this process may run on.
+
+  Unlike os.cpu_count(), respects the CPU affinity mask (e.g. taskset or
+  container cpusets) where the platform supports it.
+
+  """
+  if hasattr(os, 'sched_getaffinity'):
+    return len(os.sched_getaffinity(0))
+  return os.cpu_count()
+
+
 def listwrap(val):
   """Wrap `val` as a list.
 
@@ -5,10 +5,14 @@ called without clearing the matplotlib buffer.
 
 """
 
+import os
+import sys
 from glob import glob
 from os.path import join, basename
 from stringcase import pascalcase, titlecase
 import matplotlib as mpl
+if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+  mpl.use('Agg')                # headless: skip probing for a GUI backend
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -31,7 +35,8 @@ def show(fname=None, save=False):
   """Show the figure currently in matplotlib or save it, if not self.show.
 
   If no fname provided, and self.show is False, then closes the figure. If save
-  is True, figure is saved regardless of show.
+  is True, figure is saved regardless of show. Saved figures are closed after
+  saving, so that loops over many frames don't accumulate open figures.
 
   :param fname: name of the file to save to.
   :param save: whether to save the file.
@@ -45,6 +50,7 @@ def show(fname=None, save=False):
     plt.close()
   else:
     plt.savefig(fname)
+    plt.close()
     logger.info(f"saved figure to {fname}.")
 
 
@@ -60,7 +66,14 @@ def plot_image(*images, columns=10, ticks=True, scale=20, colorbar=False,
     if image is None:
       ax.axis('off')
       continue
-    im = ax.imshow(np.squeeze(image), cmap=cmaps[i], **kwargs)
+    image = np.asarray(image)
+    if image.ndim == 4 and image.shape[0] == 1:
+      image = image[0]
+    if image.ndim == 3 and image.shape[2] == 1:
+      image = image[:, :, 0]
+    # channel slices of model outputs are strided views, copy them once here
+    image = np.ascontiguousarray(image)
+    im = ax.imshow(image, cmap=cmaps[i], **kwargs)
     if colorbar:
       fig.colorbar(im, ax=ax, orientation='horizontal',
                    fraction=0.046, pad=0.04)
@@ -2,8 +2,10 @@
 
 Unlike most artifice scripts, this should be run from ROOT/batch."""
 
-import os
 import itertools
+from pathlib import Path
+
+CWD = Path.cwd()
 
 train_template = """#!/bin/bash
 
@@ -115,36 +117,22 @@ subset_sizes = [10, 100]
 for t in itertools.product(which_epochs, modes, datas, subset_sizes):
   print(t)
   epochs, mode, data, subset_size = t
-  dir_name = f"train/{mode}_{data}" + ("" if 'full' in mode
-                                       else f"_subset{subset_size}")
-  if not os.path.exists(dir_name):
-    os.mkdir(dir_name)
+  dir_path = CWD / 'train' / (f"{mode}_{data}" + ("" if 'full' in mode
+                                                  else f"_subset{subset_size}"))
+  dir_path.mkdir(parents=True, exist_ok=True)
 
   subset_addon = "" if 'full' in mode else "_subset${subset_size}"
   query_size = subset_size // num_active_epochs
-  out_name = os.path.join(os.getcwd(), dir_name, 'train.out')
-  err_name = os.path.join(os.getcwd(), dir_name, 'train.err')
   script = train_template.format(
     epochs=epochs, mode=mode, data=data, subset_size=subset_size,
     query_size=query_size, subset_addon=subset_addon,
-    out_name=out_name, err_name=err_name)
-  with open(os.path.join(dir_name, 'train.batch'), 'w') as f:
-    f.write(script)
-
-  cmd = 'detect'
-  out_name = os.path.join(os.getcwd(), dir_name, f'{cmd}.out')
-  err_name = os.path.join(os.getcwd(), dir_name, f'{cmd}.err')  
-  script = analysis_template.format(
-    cmd=cmd, mode=mode, data=data, subset_size=subset_size,
-    subset_addon=subset_addon, out_name=out_name, err_name=err_name)
-  with open(os.path.join(dir_name, 'detect.batch'), 'w') as f:
-    f.write(script)
-
-  cmd = 'visualize'
-  out_name = os.path.join(os.getcwd(), dir_name, f'{cmd}.out')
-  err_name = os.path.join(os.getcwd(), dir_name, f'{cmd}.err')  
-  script = analysis_template.format(
-    cmd=cmd, mode=mode, data=data, subset_size=subset_size,
-    subset_addon=subset_addon, out_name=out_name, err_name=err_name)
-  with open(os.path.join(dir_name, 'visualize.batch'), 'w') as f:
-    f.write(script)
+    out_name=str(dir_path / 'train.out'),
+    err_name=str(dir_path / 'train.err'))
+  (dir_path / 'train.batch').write_text(script)
+
+  for cmd in ['detect', 'visualize']:
+    script = analysis_template.format(
+      cmd=cmd, mode=mode, data=data, subset_size=subset_size,
+      subset_addon=subset_addon, out_name=str(dir_path / f'{cmd}.out'),
+      err_name=str(dir_path / f'{cmd}.err'))
+    (dir_path / f'{cmd}.batch').write_text(script)
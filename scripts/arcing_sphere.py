@@ -3,6 +3,7 @@ Outputs a tfrecord in data/arcing_sphere. (Should be run from $ARTIFICE)
 
 """
 
+from functools import lru_cache
 import vapory
 import numpy as np
 import matplotlib.pyplot as plt
@@ -13,7 +14,9 @@ from artifice.utils import dataset
 debug = False
 
 # helpers
-color = lambda col : vapory.Texture(vapory.Pigment('color', col))
+@lru_cache(maxsize=None)
+def color(col):
+  return vapory.Texture(vapory.Pigment('color', col))
 
 # dataset parameters
 root = "data/arcing_sphere/"    # root dir for fname
@@ -35,10 +38,13 @@ vx = 200                        # initial x velocity
 vy = 500                       # initial y velocity
 g = -981                        # gravity acceleration
 
-# experiment sphere parameters
+# experiment sphere parameters, with the whole trajectory computed up front
+ts = np.arange(N) * time_step
+positions = np.stack((vx*ts + x, 0.5*g*ts**2 + vy*ts + y, np.zeros(N)),
+                     axis=1).tolist()
+
 def argsf(t_):
-  t = t_ * time_step
-  return ([vx*t + x, 0.5*g*t**2 + vy*t + y, 0], radius)
+  return (positions[t_], radius)
 
 ball = experiment.ExperimentSphere(argsf, color('Red'))
 
@@ -27,17 +27,64 @@ logger.addHandler(handler)
 import numpy as np
 import vapory
 import os
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 import matplotlib.pyplot as plt
 from skimage import draw
 from inspect import signature
 import subprocess as sp
 import tensorflow as tf
-from artifice.utils import img, vid
+from artifice import img
 from artifice import dat
+from artifice import utils
 
 
 INFINITY = 10e9
 
+# the Experiment being run, inherited by forked render workers
+_experiment = None
+
+# shared frame buffers, written by the render workers when images are needed
+_images = None
+_annotations = None
+
+
+def _shared_array(shape, dtype, dir=None):
+  """Make an array backed by a temporary file, shared with forked processes.
+
+  :param shape: shape of the array
+  :param dtype: dtype of the array
+  :param dir: directory for the backing file, which is removed when closed
+  :returns: writable memmap
+
+  """
+  return np.memmap(tempfile.TemporaryFile(dir=dir), dtype=dtype, mode='w+',
+                   shape=shape)
+
+
+def _render_frame(t):
+  """Render frame t of the running experiment, seeding the noise by frame.
+
+  The tfrecord proto is also serialized here, so that serialization runs in
+  the worker processes rather than the writing loop. Images and annotations
+  are written into the shared buffers, if the run needs them, rather than
+  being pickled back to the parent.
+
+  :returns: `(label, proto)` pair, where proto is None without tfrecord output
+
+  """
+  np.random.seed(t)
+  example, annotation = _experiment.render_scene(t)
+  if _images is not None:
+    _images[t] = example[0]
+    _annotations[t] = annotation
+  if 'tfrecord' in _experiment.output_formats:
+    proto = dat.proto_from_example(example)
+  else:
+    proto = None
+  return example[1], proto
+
 
 def normalize(X):
   """Normalize a vector.
@@ -519,7 +566,9 @@ class Experiment:
     vap_scene = vapory.Scene(self.camera, all_objects, included=self.included)
 
     # image, annotation ndarrays of np.uint8s.
-    image = vap_scene.render(height=self.image_shape[0], width=self.image_shape[1])
+    # per-process temp file, so parallel renders don't clobber each other
+    image = vap_scene.render(height=self.image_shape[0], width=self.image_shape[1],
+                             tempfile=f"__temp__{os.getpid()}.pov")
     if self.mode == 'L':
       image = img.grayscale(image)
 
@@ -535,12 +584,22 @@ class Experiment:
 
     return (image, label), annotation
     
-  def run(self, verbose=None):
+  def run(self, verbose=None, num_workers=None):
     """Generate the dataset in each format.
+
+    Frames are rendered in parallel by a pool of forked processes, but written
+    in order.
+
+    :param num_workers: number of render processes. Defaults to the number of
+    cores available to this process.
+
     """
+    global _experiment, _images, _annotations
 
     if verbose is not None:
       logger.warning("verbose is depricated")
+    if num_workers is None:
+      num_workers = utils.available_cpus()
 
     if len(self.output_formats) == 0:
       # TODO: raise error?
@@ -559,53 +618,88 @@ class Experiment:
       logger.info("writing images to {}".format(image_dir))
     
     if 'tfrecord' in self.output_formats:
-      tfrecord_name = os.path.join(self.data_root, 'data.tfrecord')
-      tfrecord_writer = tf.python_io.TFRecordWriter(tfrecord_name)
-      logger.info("writing tfrecord to {}".format(tfrecord_name))
+      # each shard holds a contiguous run of frames, written on its own thread,
+      # so reading the shards in index order gives the frames in order
+      num_shards = min(num_workers, self.N)
+      tfrecord_writers = [tf.python_io.TFRecordWriter(
+        os.path.join(self.data_root, f'data-{i:03d}.tfrecord'))
+                          for i in range(num_shards)]
+      tfrecord_executors = [ThreadPoolExecutor(max_workers=1)
+                            for _ in range(num_shards)]
+      tfrecord_futures = []
+      logger.info("writing {} tfrecord shards to {}".format(
+        num_shards, self.data_root))
 
     if 'mp4' in self.output_formats:
+      # the writer lives in the optional artifice/mp4writer submodule
+      from artifice.mp4writer import MP4Writer
       mp4_image_name = os.path.join(self.data_root, 'data.mp4')
-      mp4_image_writer = vid.MP4Writer(
+      mp4_image_writer = MP4Writer(
         mp4_image_name, self.image_shape[:2], fps=self.fps)
       logger.info("writing video to {}".format(mp4_image_name))
       
     # step through all the frames, rendering each scene with time-dependence if
     # necessary.
-    for t in range(self.N):
-      logger.info("Rendering scene {} of {}...".format(t, self.N))
-      example, annotation = self.render_scene(t)
-      image, label = example
-      logger.debug(f"label: {label}")
-
-      if 'png' in self.output_formats:
-        fname = f"{str(t).zfill(5)}"
-        img.save(os.path.join(image_dir, fname + '.png'), np.squeeze(image))
-        np.save(os.path.join(annotation_dir, fname + '.npy'), annotation)
-        if labels is None:
-          labels = np.empty((self.N,) + label.shape)
-        labels[t] = label
-      
+    _experiment = self
+    try:
+      if 'png' in self.output_formats or 'mp4' in self.output_formats:
+        # allocated before forking, so the workers share the mapping
+        num_channels = 1 if self.mode == 'L' else 3
+        _images = _shared_array(
+          (self.N,) + self.image_shape + (num_channels,), np.uint8,
+          dir=self.data_root)
+        _annotations = _shared_array(
+          (self.N,) + self.image_shape + (1,), np.int64, dir=self.data_root)
+      with multiprocessing.get_context('fork').Pool(num_workers) as pool:
+        frames = pool.imap(_render_frame, range(self.N))
+        for t, (label, proto) in enumerate(frames):
+          logger.info("Rendered scene {} of {}".format(t, self.N))
+          logger.debug(f"label: {label}")
+          if _images is not None:
+            image = _images[t]
+            annotation = _annotations[t]
+
+          if 'png' in self.output_formats:
+            fname = f"{str(t).zfill(5)}"
+            img.save(os.path.join(image_dir, fname + '.png'),
+                     np.squeeze(image))
+            np.save(os.path.join(annotation_dir, fname + '.npy'), annotation)
+            if labels is None:
+              labels = np.empty((self.N,) + label.shape)
+            labels[t] = label
+
+          if 'tfrecord' in self.output_formats:
+            shard = t * num_shards // self.N
+            tfrecord_futures.append(tfrecord_executors[shard].submit(
+              tfrecord_writers[shard].write, proto))
+
+          if 'mp4' in self.output_formats:
+            mp4_image_writer.write(image)
+
+      if 'tfrecord' in self.output_formats:
+        for future in tfrecord_futures:
+          future.result()       # raise any errors from the writer threads
+    finally:
+      # the pool is terminated on leaving the with block, even on error
+      _experiment = None
+      _images = None
+      _annotations = None
       if 'tfrecord' in self.output_formats:
-        e = dat.proto_from_scene(scene)
-        tfrecord_writer.write(e)
-        
+        for executor, writer in zip(tfrecord_executors, tfrecord_writers):
+          executor.shutdown()
+          writer.close()
       if 'mp4' in self.output_formats:
-        mp4_image_writer.write(image)
+        mp4_image_writer.close()
 
-        
     if 'png' in self.output_formats:
-      logger.info("Finished writing images.")
       np.save(os.path.join(self.data_root, "labels.npy"), labels)
-      
+      logger.info("Finished writing images.")
     if 'tfrecord' in self.output_formats:
-      tfrecord_writer.close()
       logger.info("Finished writing tfrecord.")
-
     if 'mp4' in self.output_formats:
-      mp4_image_writer.close()
       logger.info("Finished writing video.")
 
-    
+
 def main():
   """For testing purposes"""
   pass
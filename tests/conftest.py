@@ -0,0 +1,6 @@
+"""Puts the repository root on the path, so artifice and test_utils import."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,73 @@
+"""Tests for generating experiment data.
+
+POV-Ray isn't needed: rendering is replaced with a flat gray image, and the
+rest of the experiment (labels, annotations, writers) runs as usual.
+
+"""
+
+import os
+from glob import glob
+
+import numpy as np
+import pytest
+import tensorflow as tf
+import vapory
+
+from test_utils import experiment
+
+
+N = 7
+
+
+def _render(self, *args, height=None, width=None, **kwargs):
+  return np.full((height, width, 3), 7, np.uint8)
+
+
+def _make_experiment(data_root, argsf):
+  exp = experiment.Experiment(image_shape=(32, 32), N=N,
+                              data_root=str(data_root),
+                              output_format={'tfrecord', 'png'},
+                              noisify=False)
+  exp.add_object(experiment.ExperimentSphere(
+    argsf, vapory.Texture(vapory.Pigment('color', [1, 0, 0]))))
+  return exp
+
+
+def _argsf(t):
+  return ([10. * t - 30., 0., 0.], 20.)
+
+
+def test_run(tmp_path, monkeypatch):
+  monkeypatch.setattr(vapory.Scene, 'render', _render)
+  exp = _make_experiment(tmp_path, _argsf)
+  exp.run(num_workers=3)
+
+  labels = np.load(str(tmp_path / 'labels.npy'))
+  assert labels.shape[0] == N
+  assert len(glob(str(tmp_path / 'images' / '*.png'))) == N
+  assert len(glob(str(tmp_path / 'annotations' / '*.npy'))) == N
+
+  # reading the shards in order gives the frames in order
+  record_labels = []
+  for fname in sorted(glob(str(tmp_path / 'data-*.tfrecord'))):
+    for record in tf.python_io.tf_record_iterator(fname):
+      feature = tf.train.Example.FromString(record).features.feature
+      label = np.frombuffer(feature['label'].bytes_list.value[0], np.float32)
+      record_labels.append(label.reshape(labels.shape[1:]))
+  assert len(glob(str(tmp_path / 'data-*.tfrecord'))) == 3
+  np.testing.assert_array_equal(np.stack(record_labels), labels)
+
+
+def test_run_failure(tmp_path, monkeypatch):
+  monkeypatch.setattr(vapory.Scene, 'render', _render)
+
+  def argsf(t):
+    if t == 3:
+      raise ValueError("bad frame")
+    return _argsf(t)
+
+  exp = _make_experiment(tmp_path, argsf)
+  with pytest.raises(ValueError):
+    exp.run(num_workers=2)
+  assert experiment._experiment is None
+  assert experiment._images is None
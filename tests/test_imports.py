@@ -0,0 +1,13 @@
+"""Smoke tests that the modules import."""
+
+import importlib
+
+import pytest
+
+
+@pytest.mark.parametrize('name', ['artifice.mod',
+                                  'artifice.dat',
+                                  'artifice.main',
+                                  'test_utils.experiment'])
+def test_import(name):
+  importlib.import_module(name)
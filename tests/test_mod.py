@@ -0,0 +1,33 @@
+"""Tests for the model wrappers."""
+
+import numpy as np
+import pytest
+
+from artifice import mod
+
+
+def _make_model(cls, model_dir, **kwargs):
+  return cls(base_shape=[28], level_filters=[8, 4], num_channels=1,
+             pose_dim=2, level_depth=2, model_dir=str(model_dir),
+             overwrite=True, batch_size=2, **kwargs)
+
+
+def test_cast_float16(tmp_path):
+  model = _make_model(mod.UNet, tmp_path)
+  model.cast('float16')
+  assert model.model.inputs[0].dtype == 'float16'
+  inputs = np.random.rand(2, *model.input_shape).astype(np.float32)
+  outputs = model.predict_on_batch(inputs)
+  assert len(outputs) == len(model.model.outputs)
+  for output in outputs:
+    assert output.dtype == np.float32
+
+
+@pytest.mark.parametrize('cls', [mod.SparseUNet,
+                                 mod.BetterSparseUNet,
+                                 mod.AutoSparseUNet])
+def test_cast_float16_sparse(cls, tmp_path):
+  model = _make_model(cls, tmp_path, tol=0.1)
+  with pytest.raises(NotImplementedError):
+    model.cast('float16')
+  model.cast('float32')